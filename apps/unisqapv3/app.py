@@ -1,5 +1,5 @@
 import math
-from decimal import Decimal, getcontext
+from decimal import Decimal
 import numpy as np
 import streamlit as st
 import matplotlib.pyplot as plt
@@ -8,7 +8,6 @@ st.set_page_config(page_title="Uniswap V3 Milestone 1 Explorer", layout="wide")
 
 # ---------- Helpers ----------
 Q96_INT = 2**96
-Q96_DEC = Decimal(2) ** 96
 
 def tick_from_price(P: float) -> int:
     # tick = floor(log_{1.0001}(P))
@@ -22,10 +21,10 @@ def sqrtPriceX96_float(P: float) -> int:
     # book-style: int(sqrt(P) * 2^96) using float sqrt
     return int(math.sqrt(P) * Q96_INT)
 
-def sqrtPriceX96_decimal(P: Decimal, prec: int = 80) -> int:
-    # true high-precision: floor(sqrt(P) * 2^96)
-    getcontext().prec = prec
-    return int((P.sqrt() * Q96_DEC))
+def sqrtPriceX96_exact(P: Decimal) -> int:
+    # floor(sqrt(P) * 2^96) == isqrt(floor(P * 2^192)), exact in integers
+    n, d = P.as_integer_ratio()
+    return math.isqrt((n << 192) // d)
 
 def sqrtPriceX96_tick_quantized(P: float) -> tuple[int, int, float]:
     # price -> tick -> sqrtP -> sqrtPriceX96
@@ -116,14 +115,14 @@ with right:
     tick_low = tick_from_price(pmin)
     tick_upp = tick_from_price(pmax)
 
-    # sqrtPriceX96 by float & decimal
+    # sqrtPriceX96 by float & exact integer sqrt
     sqrtX96_cur_float = sqrtPriceX96_float(P_cur)
-    sqrtX96_cur_dec = sqrtPriceX96_decimal(Decimal(str(P_cur)))
+    sqrtX96_cur_exact = sqrtPriceX96_exact(Decimal(str(P_cur)))
 
     # Tick-quantized
     t_q, sqrtX96_cur_tick, sqrtP_cur_tick = sqrtPriceX96_tick_quantized(P_cur)
 
-    # Also show exact (Decimal) vs float difference like the mismatch you observed
+    # Also show exact (isqrt) vs float difference like the mismatch you observed
     st.markdown("**Current price computations:**")
     c1, c2, c3 = st.columns(3)
     with c1:
@@ -133,11 +132,11 @@ with right:
         st.metric("sqrtPriceX96 (float sqrt)", format_int(sqrtX96_cur_float))
         st.caption("int(math.sqrt(P) * 2^96) — matches many tutorials")
     with c3:
-        st.metric("sqrtPriceX96 (Decimal sqrt)", format_int(sqrtX96_cur_dec))
-        st.caption("floor(sqrt(P) * 2^96) with high precision")
+        st.metric("sqrtPriceX96 (exact isqrt)", format_int(sqrtX96_cur_exact))
+        st.caption("floor(sqrt(P) * 2^96) exactly, via math.isqrt")
 
     st.write("Differences:")
-    st.write(f"- float − Decimal = **{format_big_diff(sqrtX96_cur_float, sqrtX96_cur_dec)}**")
+    st.write(f"- float − exact = **{format_big_diff(sqrtX96_cur_float, sqrtX96_cur_exact)}**")
     st.write(f"- tick-quantized tick = **{t_q}**")
     st.write(f"- sqrtPriceX96(tick) ≈ **{format_int(sqrtX96_cur_tick)}**")
     st.caption("Uniswap core effectively operates on the tick grid; the 'price' you initialize is quantized to that grid.")
@@ -285,7 +284,7 @@ else:
 #st.markdown(
 """
 - Flip **token0/token1** and watch how **P** becomes **1/price** — this is the biggest source of confusion in many tutorials.
-- Compare **float sqrtPriceX96** vs **Decimal sqrtPriceX96** to see why the book’s integer can be “off” from exact math.
+- Compare **float sqrtPriceX96** vs **exact (isqrt) sqrtPriceX96** to see why the book’s integer can be “off” from exact math.
 - Watch **tick quantization**: current price snaps to a tick grid. This is why “exact” price initialization is not truly continuous.
 - Change the range width and amounts to see when **L0** or **L1** becomes limiting.
 """
@@ -1,50 +1,90 @@
 import math
-from decimal import Decimal, getcontext
+from decimal import Decimal
 import numpy as np
 import streamlit as st
-import matplotlib.pyplot as plt
 
 st.set_page_config(page_title="Uniswap V3 Milestone 1 Explorer", layout="wide")
 
 # ---------- Helpers ----------
 Q96_INT = 2**96
-Q96_DEC = Decimal(2) ** 96
+_INV_LOG_1_0001 = 1.0 / math.log(1.0001)
+_HALF_LOG_1_0001 = 0.5 * math.log(1.0001)
+
+MAX_TICK = 887272
+
+# TickMath.getSqrtRatioAtTick magic numbers: 2^128 / sqrt(1.0001)^(2^i), i = 0..19
+_SQRT_RATIO_TABLE = (
+    0xfffcb933bd6fad37aa2d162d1a594001,
+    0xfff97272373d413259a46990580e213a,
+    0xfff2e50f5f656932ef12357cf3c7fdcc,
+    0xffe5caca7e10e4e61c3624eaa0941cd0,
+    0xffcb9843d60f6159c9db58835c926644,
+    0xff973b41fa98c081472e6896dfb254c0,
+    0xff2ea16466c96a3843ec78b326b52861,
+    0xfe5dee046a99a2a811c461f1969c3053,
+    0xfcbe86c7900a88aedcffc83b479aa3a4,
+    0xf987a7253ac413176f2b074cf7815e54,
+    0xf3392b0822b70005940c7a398e4b70f3,
+    0xe7159475a2c29b7443b29c7fa6e889d9,
+    0xd097f3bdfd2022b8845ad8f792aa5825,
+    0xa9f746462d870fdf8a65dc1f90e061e5,
+    0x70d869a156d2a1b890bb3df62baf32f7,
+    0x31be135f97d08fd981231505542fcfa6,
+    0x9aa508b5b7a84e1c677de54f3e99bc9,
+    0x5d6af8dedb81196699c329225ee604,
+    0x2216e584f5fa1ea926041bedfe98,
+    0x48a170391f7dc42444e8fa2,
+)
 
 def tick_from_price(P: float) -> int:
     # tick = floor(log_{1.0001}(P))
-    return math.floor(math.log(P) / math.log(1.0001))
+    return math.floor(math.log(P) * _INV_LOG_1_0001)
 
 def sqrtP_from_tick(tick: int) -> float:
-    # sqrtP = sqrt(1.0001^tick) = 1.0001^(tick/2)
-    return 1.0001 ** (tick / 2.0)
+    # sqrtP = sqrt(1.0001^tick) = 1.0001^(tick/2) = exp(tick * ln(1.0001) / 2)
+    return math.exp(tick * _HALF_LOG_1_0001)
 
 def sqrtPriceX96_float(P: float) -> int:
     # book-style: int(sqrt(P) * 2^96) using float sqrt
     return int(math.sqrt(P) * Q96_INT)
 
-def sqrtPriceX96_decimal(P: Decimal, prec: int = 80) -> int:
-    # true high-precision: floor(sqrt(P) * 2^96)
-    getcontext().prec = prec
-    return int((P.sqrt() * Q96_DEC))
+def sqrtPriceX96_exact(P: Decimal) -> int:
+    # floor(sqrt(P) * 2^96) == isqrt(floor(P * 2^192)), exact in integers
+    n, d = P.as_integer_ratio()
+    return math.isqrt((n << 192) // d)
+
+def sqrtPriceX96_at_tick(tick: int) -> int:
+    # integer TickMath.getSqrtRatioAtTick: Q128.128 product over the set bits of |tick|, no floats
+    abs_tick = abs(tick)
+    if abs_tick > MAX_TICK:
+        raise ValueError(f"tick out of range [-{MAX_TICK}, {MAX_TICK}]")
+    ratio = 1 << 128
+    for i, c in enumerate(_SQRT_RATIO_TABLE):
+        if abs_tick & (1 << i):
+            ratio = (ratio * c) >> 128
+    if tick > 0:
+        ratio = ((1 << 256) - 1) // ratio
+    # Q128.128 -> Q64.96, rounding up like the contract
+    return (ratio >> 32) + (1 if ratio & 0xFFFFFFFF else 0)
 
 def sqrtPriceX96_tick_quantized(P: float) -> tuple[int, int, float]:
-    # price -> tick -> sqrtP -> sqrtPriceX96
-    t = tick_from_price(P)
-    sp = sqrtP_from_tick(t)
-    return t, int(sp * Q96_INT), sp
+    # price -> tick -> sqrtPriceX96 exactly as the pool would store it (sqrtP kept for display);
+    # ticks past TickMath's range are clamped to the boundary, as the pool can't go further
+    t = max(-MAX_TICK, min(MAX_TICK, tick_from_price(P)))
+    return t, sqrtPriceX96_at_tick(t), sqrtP_from_tick(t)
 
-def liquidity0(amount0_wei: int, sqrtP_a: int, sqrtP_b: int) -> float:
+def liquidity0(amount0_wei: int, sqrtP_a: int, sqrtP_b: int) -> int:
     # L0 = amount0 * (sqrtPa*sqrtPb/Q96) / (sqrtPb - sqrtPa)
-    # This matches typical V3 formulas with Q96 scaling
+    # This matches typical V3 formulas with Q96 scaling; /Q96 is a shift, all integer (mulDiv-style floor)
     if sqrtP_a > sqrtP_b:
         sqrtP_a, sqrtP_b = sqrtP_b, sqrtP_a
-    return (amount0_wei * (sqrtP_a * sqrtP_b) / Q96_INT) / (sqrtP_b - sqrtP_a)
+    return ((amount0_wei * sqrtP_a * sqrtP_b) >> 96) // (sqrtP_b - sqrtP_a)
 
-def liquidity1(amount1_wei: int, sqrtP_a: int, sqrtP_b: int) -> float:
+def liquidity1(amount1_wei: int, sqrtP_a: int, sqrtP_b: int) -> int:
     # L1 = amount1 * Q96 / (sqrtPb - sqrtPa)
     if sqrtP_a > sqrtP_b:
         sqrtP_a, sqrtP_b = sqrtP_b, sqrtP_a
-    return amount1_wei * Q96_INT / (sqrtP_b - sqrtP_a)
+    return (amount1_wei << 96) // (sqrtP_b - sqrtP_a)
 
 def format_int(n: int) -> str:
     return f"{n:,}"
@@ -116,14 +156,16 @@ with right:
     tick_low = tick_from_price(pmin)
     tick_upp = tick_from_price(pmax)
 
-    # sqrtPriceX96 by float & decimal
+    # sqrtPriceX96 by float & exact integer sqrt
     sqrtX96_cur_float = sqrtPriceX96_float(P_cur)
-    sqrtX96_cur_dec = sqrtPriceX96_decimal(Decimal(str(P_cur)))
+    sqrtX96_cur_exact = sqrtPriceX96_exact(Decimal(str(P_cur)))
 
     # Tick-quantized
+    if abs(tick_cur) > MAX_TICK:
+        st.warning(f"Current tick {tick_cur} is outside Uniswap's tick range [-{MAX_TICK}, {MAX_TICK}]; the tick-quantized values below use the boundary tick.")
     t_q, sqrtX96_cur_tick, sqrtP_cur_tick = sqrtPriceX96_tick_quantized(P_cur)
 
-    # Also show exact (Decimal) vs float difference like the mismatch you observed
+    # Also show exact (isqrt) vs float difference like the mismatch you observed
     st.markdown("**Current price computations:**")
     c1, c2, c3 = st.columns(3)
     with c1:
@@ -133,23 +175,24 @@ with right:
         st.metric("sqrtPriceX96 (float sqrt)", format_int(sqrtX96_cur_float))
         st.caption("int(math.sqrt(P) * 2^96) — matches many tutorials")
     with c3:
-        st.metric("sqrtPriceX96 (Decimal sqrt)", format_int(sqrtX96_cur_dec))
-        st.caption("floor(sqrt(P) * 2^96) with high precision")
+        st.metric("sqrtPriceX96 (exact isqrt)", format_int(sqrtX96_cur_exact))
+        st.caption("floor(sqrt(P) * 2^96) exactly, via math.isqrt")
 
     st.write("Differences:")
-    st.write(f"- float − Decimal = **{format_big_diff(sqrtX96_cur_float, sqrtX96_cur_dec)}**")
+    st.write(f"- float − exact = **{format_big_diff(sqrtX96_cur_float, sqrtX96_cur_exact)}**")
     st.write(f"- tick-quantized tick = **{t_q}**")
-    st.write(f"- sqrtPriceX96(tick) ≈ **{format_int(sqrtX96_cur_tick)}**")
+    st.write(f"- sqrtPriceX96(tick) = **{format_int(sqrtX96_cur_tick)}** (TickMath)")
     st.caption("Uniswap core effectively operates on the tick grid; the 'price' you initialize is quantized to that grid.")
 
     st.divider()
 
     st.subheader("B) Compute sqrtPriceX96 at range bounds")
-    sqrtX96_low = sqrtPriceX96_float(pmin)
-    sqrtX96_upp = sqrtPriceX96_float(pmax)
+    # exact floor(sqrt(P) * 2^96): the float version above is only for the tutorial comparison
+    sqrtX96_low = sqrtPriceX96_exact(Decimal(str(pmin)))
+    sqrtX96_upp = sqrtPriceX96_exact(Decimal(str(pmax)))
 
     st.write(f"sqrtPriceX96(low)  = {format_int(sqrtX96_low)}")
-    st.write(f"sqrtPriceX96(cur)  = {format_int(sqrtX96_cur_float)}")
+    st.write(f"sqrtPriceX96(cur)  = {format_int(sqrtX96_cur_exact)}")
     st.write(f"sqrtPriceX96(upp)  = {format_int(sqrtX96_upp)}")
 
     st.write(f"ticks: low={tick_low}, cur={tick_cur}, upp={tick_upp}")
@@ -165,18 +208,18 @@ with right:
     # Use current and bounds (like the milestone)
     # For L0: use [cur, upp]
     # For L1: use [low, cur]
-    liq0 = liquidity0(amount0_int, sqrtX96_cur_float, sqrtX96_upp)
-    liq1 = liquidity1(amount1_int, sqrtX96_cur_float, sqrtX96_low)
+    liq0 = liquidity0(amount0_int, sqrtX96_cur_exact, sqrtX96_upp)
+    liq1 = liquidity1(amount1_int, sqrtX96_cur_exact, sqrtX96_low)
 
-    L = int(min(liq0, liq1))
+    L = min(liq0, liq1)
     limiting = "token0-side (L0)" if liq0 < liq1 else "token1-side (L1)"
 
     c1, c2, c3 = st.columns(3)
     with c1:
-        st.metric("L0 (from token0)", f"{int(liq0):,}")
+        st.metric("L0 (from token0)", f"{liq0:,}")
         st.caption("Uses amount0 and (cur, upper)")
     with c2:
-        st.metric("L1 (from token1)", f"{int(liq1):,}")
+        st.metric("L1 (from token1)", f"{liq1:,}")
         st.caption("Uses amount1 and (lower, cur)")
     with c3:
         st.metric("Chosen L = min(L0, L1)", f"{L:,}")
@@ -210,8 +253,6 @@ with right:
 #st.pyplot(fig)
 
 # ---------- Better Plot ----------
-import plotly.graph_objects as go
-
 st.subheader("Interactive: Price range & tick quantization (Milestone 1)")
 
 # Ensure valid ordering
@@ -234,7 +275,8 @@ else:
     tick_cur = tick_from_price(P_cur_slider)
     P_tick = 1.0001 ** tick_cur
 
-    # Build interactive plot
+    # Build interactive plot (plotly is only imported when we actually draw)
+    import plotly.graph_objects as go
     fig = go.Figure()
 
     # Range bounds
@@ -285,7 +327,7 @@ else:
 #st.markdown(
 """
 - Flip **token0/token1** and watch how **P** becomes **1/price** — this is the biggest source of confusion in many tutorials.
-- Compare **float sqrtPriceX96** vs **Decimal sqrtPriceX96** to see why the book’s integer can be “off” from exact math.
+- Compare **float sqrtPriceX96** vs **exact (isqrt) sqrtPriceX96** to see why the book’s integer can be “off” from exact math.
 - Watch **tick quantization**: current price snaps to a tick grid. This is why “exact” price initialization is not truly continuous.
 - Change the range width and amounts to see when **L0** or **L1** becomes limiting.
 """
@@ -3,6 +3,35 @@ import numpy as np
 import streamlit as st
 
 Q96 = 2**96
+_LOG_1_0001 = math.log(1.0001)
+_INV_LOG_1_0001 = 1.0 / _LOG_1_0001
+
+MIN_TICK = -887272
+MAX_TICK = 887272
+
+# TickMath.getSqrtRatioAtTick magic numbers: 2^128 / sqrt(1.0001)^(2^i), i = 0..19
+_SQRT_RATIO_TABLE = (
+    0xfffcb933bd6fad37aa2d162d1a594001,
+    0xfff97272373d413259a46990580e213a,
+    0xfff2e50f5f656932ef12357cf3c7fdcc,
+    0xffe5caca7e10e4e61c3624eaa0941cd0,
+    0xffcb9843d60f6159c9db58835c926644,
+    0xff973b41fa98c081472e6896dfb254c0,
+    0xff2ea16466c96a3843ec78b326b52861,
+    0xfe5dee046a99a2a811c461f1969c3053,
+    0xfcbe86c7900a88aedcffc83b479aa3a4,
+    0xf987a7253ac413176f2b074cf7815e54,
+    0xf3392b0822b70005940c7a398e4b70f3,
+    0xe7159475a2c29b7443b29c7fa6e889d9,
+    0xd097f3bdfd2022b8845ad8f792aa5825,
+    0xa9f746462d870fdf8a65dc1f90e061e5,
+    0x70d869a156d2a1b890bb3df62baf32f7,
+    0x31be135f97d08fd981231505542fcfa6,
+    0x9aa508b5b7a84e1c677de54f3e99bc9,
+    0x5d6af8dedb81196699c329225ee604,
+    0x2216e584f5fa1ea926041bedfe98,
+    0x48a170391f7dc42444e8fa2,
+)
 
 # ----------------------------
 # Uniswap V3-ish helper math
@@ -18,28 +47,44 @@ def price_to_sqrtp_x96(price: float) -> int:
 def price_to_tick(price: float) -> int:
     if price <= 0:
         return 0
-    return int(math.floor(math.log(price) / math.log(1.0001)))
+    return int(math.floor(math.log(price) * _INV_LOG_1_0001))
 
 def tick_to_price(tick: int) -> float:
-    return 1.0001 ** tick
+    # 1.0001^tick == exp(tick * ln 1.0001)
+    return math.exp(tick * _LOG_1_0001)
 
 def tick_to_sqrtp_x96(tick: int) -> int:
-    return price_to_sqrtp_x96(tick_to_price(tick))
+    # Integer port of TickMath.getSqrtRatioAtTick: Q128.128 product over the set bits of |tick|
+    abs_tick = abs(tick)
+    if abs_tick > MAX_TICK:
+        raise ValueError(f"tick out of range [{MIN_TICK}, {MAX_TICK}]")
+    ratio = 1 << 128
+    for i, c in enumerate(_SQRT_RATIO_TABLE):
+        if abs_tick & (1 << i):
+            ratio = (ratio * c) >> 128
+    if tick > 0:
+        ratio = ((1 << 256) - 1) // ratio
+    # Q128.128 -> Q64.96, rounding up like the contract
+    return (ratio >> 32) + (1 if ratio & 0xFFFFFFFF else 0)
 
 def calc_amount1(L: int, sqrtp_b_x96: int, sqrtp_a_x96: int) -> int:
     # amount1 = L * (sqrtP_b - sqrtP_a) / Q96
     if sqrtp_b_x96 < sqrtp_a_x96:
         sqrtp_b_x96, sqrtp_a_x96 = sqrtp_a_x96, sqrtp_b_x96
-    return (L * (sqrtp_b_x96 - sqrtp_a_x96)) // Q96
+    return (L * (sqrtp_b_x96 - sqrtp_a_x96)) >> 96
 
 def calc_amount0(L: int, sqrtp_b_x96: int, sqrtp_a_x96: int) -> int:
     # amount0 = L * (sqrtP_b - sqrtP_a) / (sqrtP_b * sqrtP_a) * Q96
     if sqrtp_b_x96 < sqrtp_a_x96:
         sqrtp_b_x96, sqrtp_a_x96 = sqrtp_a_x96, sqrtp_b_x96
-    num = L * (sqrtp_b_x96 - sqrtp_a_x96) * Q96
+    num = (L * (sqrtp_b_x96 - sqrtp_a_x96)) << 96
     den = sqrtp_b_x96 * sqrtp_a_x96
     return num // den
 
+def _calc_amount0_fast(LQ: int, delta: int, prod_ab: int) -> int:
+    # calc_amount0 with L*Q96 and sqrtP_b*sqrtP_a already computed by the caller
+    return (LQ * delta) // prod_ab
+
 def swap_token1_in_for_token0_out_single_range(L: int, sqrtp_cur_x96: int, amount1_in: int):
     """
     Single active range swap: token1 in -> token0 out (price increases)
@@ -54,12 +99,20 @@ def swap_token1_in_for_token0_out_single_range(L: int, sqrtp_cur_x96: int, amoun
     if amount1_in < 0:
         raise ValueError("amount1_in must be >= 0")
 
-    d_sqrtp = (amount1_in * Q96) // L
+    d_sqrtp = (amount1_in << 96) // L
     sqrtp_next = sqrtp_cur_x96 + d_sqrtp
-    amount0_out = calc_amount0(L, sqrtp_next, sqrtp_cur_x96)
+    amount0_out = _calc_amount0_fast(L << 96, d_sqrtp, sqrtp_next * sqrtp_cur_x96)
     return sqrtp_next, amount0_out
 
 
+def price_range(lower_tick: int, upper_tick: int, n: int = 240):
+    # at most n samples, never finer than one per tick (abs: an inverted range still gets a full grid)
+    n = int(min(n, max(2, abs(upper_tick - lower_tick) + 1)))
+    ticks = np.linspace(lower_tick, upper_tick, num=n, dtype=np.int64)
+    # 1.0001^t == exp(t * ln 1.0001): one vectorized ufunc instead of a per-tick loop
+    return ticks, np.exp(ticks * _LOG_1_0001)
+
+
 # ----------------------------
 # UI helpers
 # ----------------------------
@@ -162,11 +215,12 @@ with st.sidebar:
         upper_price_ui = st.number_input("Upper price", min_value=1e-12, value=float(upper_price), step=1.0, format="%.6f")
         if lower_price_ui >= upper_price_ui:
             st.error("Lower price must be < upper price")
-        lower_tick = price_to_tick(lower_price_ui)
-        upper_tick = price_to_tick(upper_price_ui)
+        # prices past TickMath's range map to the boundary ticks
+        lower_tick = max(MIN_TICK, min(MAX_TICK, price_to_tick(lower_price_ui)))
+        upper_tick = max(MIN_TICK, min(MAX_TICK, price_to_tick(upper_price_ui)))
     else:
-        lower_tick = st.number_input("Lower tick", value=int(price_to_tick(lower_price)), step=1)
-        upper_tick = st.number_input("Upper tick", value=int(price_to_tick(upper_price)), step=1)
+        lower_tick = st.number_input("Lower tick", min_value=MIN_TICK, max_value=MAX_TICK, value=int(price_to_tick(lower_price)), step=1)
+        upper_tick = st.number_input("Upper tick", min_value=MIN_TICK, max_value=MAX_TICK, value=int(price_to_tick(upper_price)), step=1)
         if lower_tick >= upper_tick:
             st.error("Lower tick must be < upper tick")
 
@@ -207,7 +261,8 @@ if do_clamp:
         sqrtp_next_x96 = sqrtp_upper_x96
         clamped = True
     # recompute output for clamped end
-    amount0_out_raw = calc_amount0(L, sqrtp_next_x96, sqrtp_cur_x96)
+    if clamped:
+        amount0_out_raw = calc_amount0(L, sqrtp_next_x96, sqrtp_cur_x96)
 
 price_next = sqrtp_x96_to_price(sqrtp_next_x96)
 tick_next = price_to_tick(price_next)
@@ -265,14 +320,22 @@ st.markdown("---")
 
 st.subheader("Visualization: price over the chosen tick range")
 
-ticks = np.linspace(int(lower_tick), int(upper_tick), num=240, dtype=int)
-prices = np.array([tick_to_price(int(t)) for t in ticks], dtype=float)
+ticks, prices = price_range(int(lower_tick), int(upper_tick))
 
 # Simple line chart (index vs price)
 st.line_chart(prices)
 
 def nearest_index(arr, value):
-    return int(np.argmin(np.abs(arr - value)))
+    # an inverted range (lower > upper, flagged above) gives a descending grid: fall back to a scan
+    if arr[0] > arr[-1]:
+        return int(np.argmin(np.abs(arr - value)))
+    # arr is ascending (1.0001^t over increasing ticks): binary search, then pick the closer neighbour
+    i = int(np.searchsorted(arr, value))
+    if i == 0:
+        return 0
+    if i == len(arr):
+        return i - 1
+    return i if arr[i] - value < value - arr[i - 1] else i - 1
 
 i_cur = nearest_index(prices, price_cur_ui)
 i_next = nearest_index(prices, price_next)
@@ -292,7 +355,7 @@ st.markdown(
 ### What this demo intentionally does NOT include (yet)
 - Multi-range / crossing ticks (where L changes as you move across ranges)
 - Fees (0.05%/0.3%/1%) and exact rounding behavior
-- Exact Uniswap v3 TickMath / SqrtPriceMath solidity-equivalent rounding
+- Exact SqrtPriceMath solidity-equivalent rounding in the swap step (the range bounds do use an exact TickMath `getSqrtRatioAtTick` port; the current price is still a float conversion)
 """
 )
 
@@ -1,17 +1,21 @@
 import math
+from collections import deque
 import streamlit as st
 from dataclasses import dataclass
-from typing import Dict, Tuple, List
+from typing import Deque, Dict, Tuple, List
 
 # -----------------------------
 # Fixed-point helpers (for display/math consistency)
 # -----------------------------
 Q96 = 2**96
 
+_INV_LOG2_10001 = 1.0 / math.log2(1.0001)
+
 def price_to_tick(price: float) -> int:
     if price <= 0:
         return 0
-    return int(math.floor(math.log(price) / math.log(1.0001)))
+    # one log2 and a multiply instead of two logs and a divide
+    return int(math.floor(math.log2(price) * _INV_LOG2_10001))
 
 def tick_to_price(tick: int) -> float:
     return 1.0001 ** tick
@@ -33,16 +37,23 @@ def amount1_delta(L: int, sqrtp_b_x96: int, sqrtp_a_x96: int) -> int:
     # amount1 = L * (sqrtPb - sqrtPa) / Q96
     if sqrtp_b_x96 < sqrtp_a_x96:
         sqrtp_b_x96, sqrtp_a_x96 = sqrtp_a_x96, sqrtp_b_x96
-    return (L * (sqrtp_b_x96 - sqrtp_a_x96)) // Q96
+    return (L * (sqrtp_b_x96 - sqrtp_a_x96)) >> 96
 
 def amount0_delta(L: int, sqrtp_b_x96: int, sqrtp_a_x96: int) -> int:
     # amount0 = L * (sqrtPb - sqrtPa) / (sqrtPb * sqrtPa) * Q96
     if sqrtp_b_x96 < sqrtp_a_x96:
         sqrtp_b_x96, sqrtp_a_x96 = sqrtp_a_x96, sqrtp_b_x96
-    num = L * (sqrtp_b_x96 - sqrtp_a_x96) * Q96
+    num = (L * (sqrtp_b_x96 - sqrtp_a_x96)) << 96
     den = sqrtp_b_x96 * sqrtp_a_x96
     return num // den
 
+# Same deltas for callers that already guarantee sqrtp_b >= sqrtp_a (Pool internals): no compare/swap
+def _amount1_delta_ordered(L: int, sqrtp_b_x96: int, sqrtp_a_x96: int) -> int:
+    return (L * (sqrtp_b_x96 - sqrtp_a_x96)) >> 96
+
+def _amount0_delta_ordered(L: int, sqrtp_b_x96: int, sqrtp_a_x96: int) -> int:
+    return ((L * (sqrtp_b_x96 - sqrtp_a_x96)) << 96) // (sqrtp_b_x96 * sqrtp_a_x96)
+
 
 # -----------------------------
 # Simple ERC20-like token ledger
@@ -51,34 +62,46 @@ class Token:
     def __init__(self, symbol: str, decimals: int):
         self.symbol = symbol
         self.decimals = decimals
-        self.bal: Dict[str, int] = {}              # address -> raw int
-        self.allow: Dict[Tuple[str, str], int] = {} # (owner, spender) -> raw int
+        self._scale = 10 ** decimals
+        # address -> [raw balance, {spender: raw allowance}]: one lookup per owner serves both
+        self.accounts: Dict[str, list] = {}
+
+    def _account(self, addr: str) -> list:
+        acct = self.accounts.get(addr)
+        if acct is None:
+            acct = self.accounts[addr] = [0, {}]
+        return acct
 
     def raw(self, human: float) -> int:
-        return int(human * (10 ** self.decimals))
+        return int(human * self._scale)
 
     def human(self, raw_amt: int) -> float:
-        return raw_amt / (10 ** self.decimals)
+        return raw_amt / self._scale
 
     def balance_of(self, addr: str) -> int:
-        return self.bal.get(addr, 0)
+        acct = self.accounts.get(addr)
+        return acct[0] if acct is not None else 0
 
     def mint(self, addr: str, raw_amt: int):
-        self.bal[addr] = self.balance_of(addr) + raw_amt
+        self._account(addr)[0] += raw_amt
 
     def approve(self, owner: str, spender: str, raw_amt: int):
-        self.allow[(owner, spender)] = raw_amt
+        self._account(owner)[1][spender] = raw_amt
 
     def allowance(self, owner: str, spender: str) -> int:
-        return self.allow.get((owner, spender), 0)
+        acct = self.accounts.get(owner)
+        return acct[1].get(spender, 0) if acct is not None else 0
 
     def transfer(self, sender: str, to: str, raw_amt: int):
         if raw_amt < 0:
             raise ValueError("transfer amount < 0")
-        if self.balance_of(sender) < raw_amt:
+        # a sender with no record has balance 0; don't create one before the checks pass
+        src = self.accounts.get(sender)
+        if (src[0] if src is not None else 0) < raw_amt:
             raise ValueError(f"{self.symbol}: insufficient balance")
-        self.bal[sender] -= raw_amt
-        self.bal[to] = self.balance_of(to) + raw_amt
+        if src is not None:
+            src[0] -= raw_amt
+        self._account(to)[0] += raw_amt
 
     def transfer_from(self, spender: str, owner: str, to: str, raw_amt: int):
         """
@@ -86,15 +109,19 @@ class Token:
         """
         if raw_amt < 0:
             raise ValueError("transferFrom amount < 0")
-        allowed = self.allowance(owner, spender)
+        if raw_amt == 0:
+            return
+        # an owner with no record has no balance or allowances (raw_amt > 0 here, so it fails below)
+        src = self.accounts.get(owner)
+        allowed = src[1].get(spender, 0) if src is not None else 0
         if allowed < raw_amt:
             raise ValueError(f"{self.symbol}: allowance too low (allowed={allowed}, need={raw_amt})")
-        if self.balance_of(owner) < raw_amt:
+        if src[0] < raw_amt:
             raise ValueError(f"{self.symbol}: owner balance too low")
         # decrement allowance + move funds
-        self.allow[(owner, spender)] = allowed - raw_amt
-        self.bal[owner] -= raw_amt
-        self.bal[to] = self.balance_of(to) + raw_amt
+        src[1][spender] = allowed - raw_amt
+        src[0] -= raw_amt
+        self._account(to)[0] += raw_amt
 
 
 # -----------------------------
@@ -102,10 +129,18 @@ class Token:
 # -----------------------------
 @dataclass
 class CallbackData:
-    token0_symbol: str
-    token1_symbol: str
+    token0: Token
+    token1: Token
     payer: str
 
+    @property
+    def token0_symbol(self) -> str:
+        return self.token0.symbol
+
+    @property
+    def token1_symbol(self) -> str:
+        return self.token1.symbol
+
 
 # -----------------------------
 # Pool + Manager simulation
@@ -124,22 +159,44 @@ class Pool:
         self.sqrtp_x96 = int(math.sqrt(price_init) * Q96)
         self.lower_tick = price_to_tick(price_init * 0.91)  # default-ish
         self.upper_tick = price_to_tick(price_init * 1.10)
+        # range bounds only change in set_range, so their sqrtP is cached alongside the ticks
+        self._sqrtL_x96 = tick_to_sqrtp_x96(self.lower_tick)
+        self._sqrtU_x96 = tick_to_sqrtp_x96(self.upper_tick)
         self.L = 0  # active liquidity
+        self._info_cache = None  # (state key, info dict); state only changes on mint/swap
+        self._price_cache = None
+        self._price_cache_key = None  # sqrtp_x96 the cached price was computed from
+
+    @property
+    def price(self) -> float:
+        if self._price_cache_key == self.sqrtp_x96:
+            return self._price_cache
+        self._price_cache = sqrtp_x96_to_price(self.sqrtp_x96)
+        self._price_cache_key = self.sqrtp_x96
+        return self._price_cache
 
     def info(self):
-        return {
-            "price": sqrtp_x96_to_price(self.sqrtp_x96),
-            "tick": price_to_tick(sqrtp_x96_to_price(self.sqrtp_x96)),
+        key = (self.sqrtp_x96, self.lower_tick, self.upper_tick, self.L)
+        if self._info_cache is not None and self._info_cache[0] == key:
+            return self._info_cache[1]
+        price = self.price
+        info = {
+            "price": price,
+            "tick": price_to_tick(price),
             "lower_tick": self.lower_tick,
             "upper_tick": self.upper_tick,
             "L": self.L,
         }
+        self._info_cache = (key, info)
+        return info
 
     def set_range(self, lower_tick: int, upper_tick: int):
         if lower_tick >= upper_tick:
             raise ValueError("lower_tick must be < upper_tick")
         self.lower_tick = lower_tick
         self.upper_tick = upper_tick
+        self._sqrtL_x96 = tick_to_sqrtp_x96(lower_tick)
+        self._sqrtU_x96 = tick_to_sqrtp_x96(upper_tick)
 
     def _required_amounts_for_liquidity(self, L_add: int) -> Tuple[int, int]:
         """
@@ -147,16 +204,16 @@ class Pool:
           amount0 = L * (sqrtU - sqrtC) / (sqrtU * sqrtC) * Q96
           amount1 = L * (sqrtC - sqrtL) / Q96
         """
-        sqrtL = tick_to_sqrtp_x96(self.lower_tick)
-        sqrtU = tick_to_sqrtp_x96(self.upper_tick)
+        sqrtL = self._sqrtL_x96
+        sqrtU = self._sqrtU_x96
         sqrtC = self.sqrtp_x96
 
         if not (sqrtL <= sqrtC <= sqrtU):
             # For this milestone-style demo, keep it simple:
             raise ValueError("Current price must be inside the range for this simplified mint.")
 
-        amt0 = amount0_delta(L_add, sqrtU, sqrtC)
-        amt1 = amount1_delta(L_add, sqrtC, sqrtL)
+        amt0 = _amount0_delta_ordered(L_add, sqrtU, sqrtC)
+        amt1 = _amount1_delta_ordered(L_add, sqrtC, sqrtL)
         return amt0, amt1
 
     def mint(self, owner: str, lower_tick: int, upper_tick: int, liquidity: int, data: CallbackData, manager):
@@ -182,15 +239,17 @@ class Pool:
         """
         Simplified: token1 in -> token0 out, stays in range if possible (clamped).
         """
-        if self.L <= 0:
+        # L and the range are fixed for the whole swap: read them into locals once
+        L = self.L
+        if L <= 0:
             raise ValueError("Pool has no liquidity. Mint first.")
 
         sqrtC = self.sqrtp_x96
-        sqrtL = tick_to_sqrtp_x96(self.lower_tick)
-        sqrtU = tick_to_sqrtp_x96(self.upper_tick)
+        sqrtL = self._sqrtL_x96
+        sqrtU = self._sqrtU_x96
 
         # Move sqrtP by ΔsqrtP = amount1_in * Q96 / L
-        d_sqrtp = (amount1_in_raw * Q96) // self.L
+        d_sqrtp = (amount1_in_raw << 96) // L
         sqrtN = sqrtC + d_sqrtp
 
         # clamp to range (milestone-style single range)
@@ -201,8 +260,10 @@ class Pool:
 
         # compute actual token deltas for movement sqrtC -> sqrtN
         # pool receives amount1_in_used, and pays amount0_out
-        amt1_used = amount1_delta(self.L, sqrtN, sqrtC)
-        amt0_out  = amount0_delta(self.L, sqrtN, sqrtC)
+        # clamping can only move sqrtN below sqrtC if the price already sat above the range
+        hi, lo = (sqrtN, sqrtC) if sqrtN >= sqrtC else (sqrtC, sqrtN)
+        amt1_used = _amount1_delta_ordered(L, hi, lo)
+        amt0_out  = _amount0_delta_ordered(L, hi, lo)
 
         # callback: pool requests token1 payment
         # Use Uniswap sign convention: positive means "pool wants this token IN"
@@ -224,53 +285,69 @@ class Pool:
         return amt1_used, amt0_out
 
 
+# Event log entries are stored as (kind, *args) tuples and only formatted when the log panel renders
+_LOG_FORMATS = {
+    "approve": "Approve: {} approved {} {} to Manager",
+    "mint": "Manager.mint(pool={}, caller={}, L={}, ticks=[{},{}])",
+    "mint_result": "Pool.mint computed required: amount0={} ({}), amount1={} ({})",
+    "swap": "Manager.swap(pool={}, caller={}, recipient={}, token1_in={})",
+    "swap_result": "Pool.swap result: token1_used={} ({}), token0_out={} ({})",
+    "mint_cb": "MintCallback: transferFrom payer->{}: {} {}",
+    "swap_cb": "SwapCallback: transferFrom payer->{}: {} {}",
+}
+
+
+def _fmt(entry: tuple) -> str:
+    return _LOG_FORMATS[entry[0]].format(*entry[1:])
+
+
 class Manager:
-    def __init__(self, address: str, tokens: Dict[str, Token], event_log: List[str]):
+    def __init__(self, address: str, event_log: Deque[tuple]):
         self.address = address
-        self.tokens = tokens
         self.log = event_log
 
+    def format_log(self) -> List[str]:
+        return [_fmt(e) for e in self.log]
+
     def mint(self, pool: Pool, caller: str, lower_tick: int, upper_tick: int, liquidity: int):
         # Create callback data that includes payer + token addresses/symbols (book concept) :contentReference[oaicite:3]{index=3}
-        data = CallbackData(token0_symbol=pool.token0.symbol, token1_symbol=pool.token1.symbol, payer=caller)
-        self.log.append(f"Manager.mint(pool={pool.address}, caller={caller}, L={liquidity}, ticks=[{lower_tick},{upper_tick}])")
+        data = CallbackData(token0=pool.token0, token1=pool.token1, payer=caller)
+        self.log.append(("mint", pool.address, caller, liquidity, lower_tick, upper_tick))
         amt0, amt1 = pool.mint(owner=caller, lower_tick=lower_tick, upper_tick=upper_tick, liquidity=liquidity, data=data, manager=self)
-        self.log.append(f"Pool.mint computed required: amount0={amt0} ({pool.token0.symbol}), amount1={amt1} ({pool.token1.symbol})")
+        self.log.append(("mint_result", amt0, pool.token0.symbol, amt1, pool.token1.symbol))
         return amt0, amt1
 
     def swap(self, pool: Pool, caller: str, recipient: str, token1_in_raw: int):
-        data = CallbackData(token0_symbol=pool.token0.symbol, token1_symbol=pool.token1.symbol, payer=caller)
-        self.log.append(f"Manager.swap(pool={pool.address}, caller={caller}, recipient={recipient}, token1_in={token1_in_raw})")
+        data = CallbackData(token0=pool.token0, token1=pool.token1, payer=caller)
+        self.log.append(("swap", pool.address, caller, recipient, token1_in_raw))
         amt1_used, amt0_out = pool.swap_token1_in_for_token0_out(recipient=recipient, amount1_in_raw=token1_in_raw, data=data, manager=self)
-        self.log.append(f"Pool.swap result: token1_used={amt1_used} ({pool.token1.symbol}), token0_out={amt0_out} ({pool.token0.symbol})")
+        self.log.append(("swap_result", amt1_used, pool.token1.symbol, amt0_out, pool.token0.symbol))
         return amt1_used, amt0_out
 
     # Callbacks
     def uniswapV3MintCallback(self, pool: Pool, amount0: int, amount1: int, data: CallbackData):
         # Manager pulls tokens from payer using transferFrom-like logic :contentReference[oaicite:4]{index=4}
-        t0 = self.tokens[data.token0_symbol]
-        t1 = self.tokens[data.token1_symbol]
-
         if amount0 > 0:
+            t0 = data.token0
             t0.transfer_from(spender=self.address, owner=data.payer, to=pool.address, raw_amt=amount0)
-            self.log.append(f"MintCallback: transferFrom payer->{pool.address}: {amount0} {t0.symbol}")
+            self.log.append(("mint_cb", pool.address, amount0, t0.symbol))
 
         if amount1 > 0:
+            t1 = data.token1
             t1.transfer_from(spender=self.address, owner=data.payer, to=pool.address, raw_amt=amount1)
-            self.log.append(f"MintCallback: transferFrom payer->{pool.address}: {amount1} {t1.symbol}")
+            self.log.append(("mint_cb", pool.address, amount1, t1.symbol))
 
     def uniswapV3SwapCallback(self, pool: Pool, amount0: int, amount1: int, data: CallbackData):
         # Only pay the positive side(s) to pool, like Uniswap: if amountX > 0, pool expects input token :contentReference[oaicite:5]{index=5}
-        t0 = self.tokens[data.token0_symbol]
-        t1 = self.tokens[data.token1_symbol]
-
         if amount0 > 0:
+            t0 = data.token0
             t0.transfer_from(spender=self.address, owner=data.payer, to=pool.address, raw_amt=amount0)
-            self.log.append(f"SwapCallback: transferFrom payer->{pool.address}: {amount0} {t0.symbol}")
+            self.log.append(("swap_cb", pool.address, amount0, t0.symbol))
 
         if amount1 > 0:
+            t1 = data.token1
             t1.transfer_from(spender=self.address, owner=data.payer, to=pool.address, raw_amt=amount1)
-            self.log.append(f"SwapCallback: transferFrom payer->{pool.address}: {amount1} {t1.symbol}")
+            self.log.append(("swap_cb", pool.address, amount1, t1.symbol))
 
 
 # -----------------------------
@@ -287,29 +364,28 @@ This sim models the **periphery “manager”** as an intermediary that forwards
 )
 
 # ---- session state init
+# event log panel shows this many most recent entries; older ones are dropped on append
+EVENT_LOG_MAXLEN = 80
+
 def init_state():
-    if "log" not in st.session_state:
-        st.session_state.log = []
-    if "tokens" not in st.session_state:
-        # Token0: ETH(18), Token1: USDC(6) — purely for simulation
-        eth = Token("ETH", 18)
-        usdc = Token("USDC", 6)
-        st.session_state.tokens = {"ETH": eth, "USDC": usdc}
-    if "manager" not in st.session_state:
-        st.session_state.manager = Manager(address="Manager", tokens=st.session_state.tokens, event_log=st.session_state.log)
-    if "pool" not in st.session_state:
-        pool = Pool(address="Pool1", token0=st.session_state.tokens["ETH"], token1=st.session_state.tokens["USDC"], price_init=5000.0)
-        st.session_state.pool = pool
-    if "user" not in st.session_state:
-        st.session_state.user = "Alice"
-    if "initialized_balances" not in st.session_state:
-        # give user balances
-        t0 = st.session_state.tokens["ETH"]
-        t1 = st.session_state.tokens["USDC"]
-        t0.mint("Alice", t0.raw(10.0))        # 10 ETH
-        t1.mint("Alice", t1.raw(200_000.0))   # 200k USDC
-        # pool starts empty; will receive funds during mint callback
-        st.session_state.initialized_balances = True
+    # one flag check per rerun instead of a membership test per key; "Reset demo state" clears it too
+    if st.session_state.get("_initialized_v1"):
+        return
+    log = deque(maxlen=EVENT_LOG_MAXLEN)
+    # Token0: ETH(18), Token1: USDC(6) — purely for simulation
+    eth = Token("ETH", 18)
+    usdc = Token("USDC", 6)
+    tokens = {"ETH": eth, "USDC": usdc}
+    st.session_state.log = log
+    st.session_state.tokens = tokens
+    st.session_state.manager = Manager(address="Manager", event_log=log)
+    st.session_state.pool = Pool(address="Pool1", token0=eth, token1=usdc, price_init=5000.0)
+    st.session_state.user = "Alice"
+    # give user balances
+    eth.mint("Alice", eth.raw(10.0))          # 10 ETH
+    usdc.mint("Alice", usdc.raw(200_000.0))   # 200k USDC
+    # pool starts empty; will receive funds during mint callback
+    st.session_state._initialized_v1 = True
 
 init_state()
 
@@ -335,13 +411,13 @@ with st.sidebar:
     if st.button("Approve"):
         t = tokens[approve_token]
         t.approve(owner=user, spender=manager.address, raw_amt=t.raw(approve_amount_human))
-        st.session_state.log.append(f"Approve: {user} approved {approve_amount_human} {t.symbol} to Manager")
+        st.session_state.log.append(("approve", user, approve_amount_human, t.symbol))
         st.success("Approved.")
 
     st.divider()
     st.header("2) Mint via Manager")
 
-    cur_price = pool.info()["price"]
+    cur_price = pool.price
     st.caption(f"Pool current price: {fmt_price(cur_price)} USDC/ETH")
 
     lower_price = st.number_input("Lower price (USDC/ETH)", min_value=1.0, value=4545.0, step=1.0)
@@ -384,30 +460,27 @@ with st.sidebar:
 # ---- main panels
 colA, colB = st.columns([1, 1])
 
-def balances_table(addrs: List[str]):
-    rows = []
-    for a in addrs:
-        rows.append({
-            "address": a,
-            "ETH": f"{tokens['ETH'].human(tokens['ETH'].balance_of(a)):.6f}",
-            "USDC": f"{tokens['USDC'].human(tokens['USDC'].balance_of(a)):.2f}",
-        })
-    return rows
-
-def allowances_table(owner: str, spender: str):
+def balances_table(addrs: Tuple[str, ...], eth: Token, usdc: Token):
+    return [{
+        "address": a,
+        "ETH": f"{eth.human(eth.balance_of(a)):.6f}",
+        "USDC": f"{usdc.human(usdc.balance_of(a)):.2f}",
+    } for a in addrs]
+
+def allowances_table(owner: str, spender: str, eth: Token, usdc: Token):
     return [{
         "owner": owner,
         "spender": spender,
-        "ETH_allowance": f"{tokens['ETH'].human(tokens['ETH'].allowance(owner, spender)):.6f}",
-        "USDC_allowance": f"{tokens['USDC'].human(tokens['USDC'].allowance(owner, spender)):.2f}",
+        "ETH_allowance": f"{eth.human(eth.allowance(owner, spender)):.6f}",
+        "USDC_allowance": f"{usdc.human(usdc.allowance(owner, spender)):.2f}",
     }]
 
 with colA:
     st.subheader("Balances")
-    st.dataframe(balances_table([user, manager.address, pool.address]), use_container_width=True)
+    st.dataframe(balances_table((user, manager.address, pool.address), pool.token0, pool.token1), use_container_width=True)
 
     st.subheader("Allowances (User → Manager)")
-    st.dataframe(allowances_table(user, manager.address), use_container_width=True)
+    st.dataframe(allowances_table(user, manager.address, pool.token0, pool.token1), use_container_width=True)
 
     st.subheader("Pool State")
     info = pool.info()
@@ -419,7 +492,7 @@ with colA:
 with colB:
     st.subheader("Event Log (what happened)")
     if st.session_state.log:
-        st.code("\n".join(st.session_state.log[-80:]))
+        st.code("\n".join(manager.format_log()))
     else:
         st.info("No events yet. Start with approvals, then mint, then swap.")
 